@@ -1,156 +1,410 @@
 import streamlit as st
-import pandas as pd
+from collections import defaultdict
 from datetime import datetime
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
+from xml.sax.saxutils import escape
 import base64
+import concurrent.futures
+import copy
 import io
-import json
+import itertools
+import orjson
 import os
+import string
+import tempfile
+import threading
+import types
+
+DATA_FILE = 'expense_tracker_data.json'
+EVENTS_FILE = 'expense_tracker_events.jsonl'
+SNAPSHOT_EVERY = 50  # events appended to the log before a full snapshot is written
+DATE_FORMAT = '%d/%m/%Y %H%MH'
+HISTORY_EXPANDERS = 20  # most recent expenses shown as cancellable expanders
+PDF_CELL_MAX_LINES = 20  # longer wrapped cells are cut short so a row always fits on one page
+
+# ReportLab is only needed for PDF export, so it is imported on first use rather than
+# at the top of a script that Streamlit re-runs on every interaction. The styles never
+# change, so st.cache_resource builds them once per server instead of once per export.
+
+@st.cache_resource
+def _pdf_styles():
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    styles = getSampleStyleSheet()
+    # Matches the plain-string table cells, but wraps inside its column
+    cell_style = ParagraphStyle('ExpenseCell', parent=styles['Normal'], fontName='Helvetica',
+                                fontSize=12, leading=14, alignment=TA_CENTER)
+    return styles['Title'], styles['Normal'], styles['Heading2'], cell_style
+
+@st.cache_resource
+def _pdf_table_style():
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    # Shared by the balances and expense history tables in the PDF report
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 12),
+        ('TOPPADDING', (0, 0), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
+    ])
+
+def _split_cents(expense):
+    # Fix each share in integer cents when the expense is recorded, so balance updates never
+    # re-divide and cancelling still reverses the original split after friends are removed
+    expense['amountCents'] = round(expense['amount'] * 100)
+    # remove_friend can leave a split empty; nobody then owes a share
+    expense['perPersonCents'] = expense['amountCents'] // len(expense['splitAmong']) if expense['splitAmong'] else 0
+    expense['creditCents'] = expense['perPersonCents'] * sum(1 for friend in expense['splitAmong'] if friend != expense['paidBy'])
+
+def _settle(friends, net_cents):
+    # Greedily pair the largest creditor with the largest debtor until everyone is square.
+    # Returns {creditor: {debtor: amount in dollars}} with an entry for every friend. Net entries
+    # for removed friends (e.g. put back by cancelling an expense they paid) are left out.
+    members = set(friends)
+    creditors = sorted(([friend, cents] for friend, cents in net_cents.items() if cents > 0 and friend in members), key=lambda c: -c[1])
+    debtors = sorted(([friend, -cents] for friend, cents in net_cents.items() if cents < 0 and friend in members), key=lambda d: -d[1])
+    settlements = {friend: {} for friend in friends}
+    i = j = 0
+    while i < len(creditors) and j < len(debtors):
+        creditor, debtor = creditors[i], debtors[j]
+        amount = min(creditor[1], debtor[1])
+        settlements.setdefault(creditor[0], {})[debtor[0]] = amount / 100
+        creditor[1] -= amount
+        debtor[1] -= amount
+        if creditor[1] == 0:
+            i += 1
+        if debtor[1] == 0:
+            j += 1
+    return settlements
+
+def _render_balances_html(friends, net_cents):
+    # Not cached: one settle-up pass over the friends is cheaper than st.cache_data hashing its arguments
+    balance_html = "<div style='border: 2px solid #ddd; padding: 10px; border-radius: 5px;'>"
+    for friend, owes in _settle(friends, net_cents).items():
+        balance_html += f"<h3>{friend}</h3>"
+        for ower, amount in owes.items():
+            if amount > 0:
+                balance_html += f"<p>{ower} owes {friend} ${amount:.2f}</p>"
+    balance_html += "</div>"
+    return balance_html
+
+def _column_widths(rows, available_width):
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    # Natural width of each column is its widest cell (Helvetica 12 with 6pt padding each side).
+    # Date Added and Amount always get theirs. Paid By, Description and Split Among share the
+    # rest, narrowest first, each taking at most an equal share of what is left.
+    natural = [max(stringWidth(row[col], 'Helvetica', 12) for row in rows) + 12 for col in range(5)]
+    widths = natural[:]
+    remaining = available_width - natural[0] - natural[2]
+    wrapping = sorted((1, 3, 4), key=lambda col: natural[col])
+    for n, col in enumerate(wrapping):
+        widths[col] = min(natural[col], remaining / (len(wrapping) - n))
+        remaining -= widths[col]
+    return widths
+
+def _pdf_cell(text, width, cell_style):
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.platypus import Paragraph
+    # Plain strings are much cheaper for the table to lay out, so only wrap text that overflows
+    if stringWidth(text, 'Helvetica', 12) + 12 <= width:
+        return text
+    cell = Paragraph(escape(text), cell_style)
+    max_height = PDF_CELL_MAX_LINES * cell_style.leading
+    while cell.wrap(width - 12, max_height)[1] > max_height:
+        text = text[:int(len(text) * max_height / cell.height) - 1]
+        cell = Paragraph(escape(text) + '…', cell_style)
+    return cell
 
 class ExpenseTracker:
     def __init__(self, name):
         self.name = name
         self.friends = []
-        self.expenses = []
-        self.balances = {}
+        self.expenses = {}  # keyed by id, in insertion order
+        self.next_expense_id = 1
+        self.net_cents = defaultdict(int)  # positive means the friend is owed money, negative means they owe
         self.bills = []
 
     def add_friend(self, name):
-        capitalized_name = ' '.join(word.capitalize() for word in name.split())
+        capitalized_name = string.capwords(name)
         if capitalized_name not in self.friends:
             self.friends.append(capitalized_name)
-            self.balances[capitalized_name] = {}
 
     def remove_friend(self, name):
         if name in self.friends:
             self.friends.remove(name)
-            del self.balances[name]
-            # Remove this friend from all split expenses
-            for expense in self.expenses:
-                if name in expense['splitAmong']:
-                    expense['splitAmong'].remove(name)
-            # Remove this friend from all bills
-            for bill in self.bills:
-                if name in bill['splitAmong']:
-                    bill['splitAmong'].remove(name)
-
-    def add_expense(self, paid_by, amount, description, split_among):
+            self.net_cents.pop(name, None)
+            # Remove this friend from all split expenses and bills; remove() does the
+            # membership scan itself, so don't scan the list a second time with `in`
+            for entry in itertools.chain(self.expenses.values(), self.bills):
+                try:
+                    entry['splitAmong'].remove(name)
+                except ValueError:
+                    pass
+
+    def add_expense(self, paid_by, amount, description, split_among, date=None):
+        added = datetime.fromisoformat(date) if date else datetime.now()
         expense = {
-            'id': str(len(self.expenses) + 1),
+            'id': str(self.next_expense_id),
             'paidBy': paid_by,
             'amount': float(amount),
             'description': description,
             'splitAmong': split_among,
-            'date': datetime.now().isoformat()
+            'date': added.isoformat(),
+            'dateDisplay': added.strftime(DATE_FORMAT)  # formatted once here rather than on every render
         }
-        self.expenses.append(expense)
+        _split_cents(expense)
+        self.expenses[expense['id']] = expense
+        self.next_expense_id += 1
         self.update_balances(expense)
 
-    def update_balances(self, expense):
-        per_person = expense['amount'] / len(expense['splitAmong'])
+    def submit_bills(self, bills, date=None):
+        # bills is what the submitting session saw; skip any another session already submitted
+        for bill in list(bills):
+            try:
+                self.bills.remove(bill)
+            except ValueError:
+                continue
+            self.add_expense(bill["paidBy"], bill["amount"], bill["description"], bill["splitAmong"], date)
+
+    def update_balances(self, expense, sign=1):
+        per_person = sign * expense['perPersonCents']
+        self.net_cents[expense['paidBy']] += sign * expense['creditCents']
         for friend in expense['splitAmong']:
             if friend != expense['paidBy']:
-                self.balances[expense['paidBy']][friend] = self.balances[expense['paidBy']].get(friend, 0) + per_person
-                self.balances[friend][expense['paidBy']] = self.balances[friend].get(expense['paidBy'], 0) - per_person
+                self.net_cents[friend] -= per_person
 
     def cancel_expense(self, expense_id):
-        expense = next((e for e in self.expenses if e['id'] == expense_id), None)
+        expense = self.expenses.pop(expense_id, None)
         if expense:
-            per_person = expense['amount'] / len(expense['splitAmong'])
-            for friend in expense['splitAmong']:
-                if friend != expense['paidBy']:
-                    self.balances[expense['paidBy']][friend] -= per_person
-                    self.balances[friend][expense['paidBy']] += per_person
-            self.expenses = [e for e in self.expenses if e['id'] != expense_id]
-
-    def export_to_pdf(self):
-        if 'calculators' not in st.session_state:
-            load_data()
-        tracker = st.session_state.calculators[st.session_state.current_calculator]
-        
-
+            self.update_balances(expense, sign=-1)
+
+    def settle_up(self):
+        return _settle(self.friends, self.net_cents)
+
+    def export_to_pdf(self, styles=None, table_style=None):
+        # Runs on a worker thread, so it must only read from self and never from st.session_state;
+        # callers there pass in the cached styles fetched on the script thread
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import SimpleDocTemplate, Table, LongTable, Paragraph
+        title_style, normal_style, heading_style, cell_style = styles or _pdf_styles()
+        table_style = table_style or _pdf_table_style()
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
         elements = []
 
         # Title
-        elements.append(Paragraph(f"{tracker.name.upper()}", styles['Title']))
-        elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%d/%m/%Y %H%MH')}", styles['Normal']))
+        elements.append(Paragraph(f"{self.name.upper()}", title_style))
+        elements.append(Paragraph(f"Generated on: {datetime.now().strftime(DATE_FORMAT)}", normal_style))
 
         # Current Balances
-        elements.append(Paragraph("Current Balances", styles['Heading2']))
-        for friend, owes in self.balances.items():
-            elements.append(Paragraph(friend, styles['Heading3']))
-            for ower, amount in owes.items():
-                if amount > 0:
-                    elements.append(Paragraph(f"  {ower} owes {friend} ${amount:.2f}", styles['Normal']))
+        elements.append(Paragraph("Current Balances", heading_style))
+        balance_rows = [['Creditor', 'Debtor', 'Amount']]
+        balance_rows.extend(
+            [friend, ower, f"${amount:.2f}"]
+            for friend, owes in self.settle_up().items()
+            for ower, amount in owes.items()
+            if amount > 0
+        )
+        balance_table = Table(balance_rows)
+        balance_table.setStyle(table_style)
+        elements.append(balance_table)
 
         # Expense History
-        elements.append(Paragraph("Expense History", styles['Heading2']))
+        elements.append(Paragraph("Expense History", heading_style))
         expense_data = [['Date Added', 'Paid By', 'Amount', 'Description', 'Split Among']]
-        for expense in self.expenses:
+        for expense in self.expenses.values():
             expense_data.append([
-                datetime.fromisoformat(expense['date']).strftime('%d/%m/%Y %H%MH'),
+                expense['dateDisplay'],
                 expense['paidBy'],
                 f"${expense['amount']:.2f}",
                 expense['description'],
                 ', '.join(expense['splitAmong'])
             ])
+        col_widths = _column_widths(expense_data, doc.width)
+        for row in expense_data[1:]:
+            for col in (1, 3, 4):
+                row[col] = _pdf_cell(row[col], col_widths[col], cell_style)
 
-        table = Table(expense_data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 12),
-            ('TOPPADDING', (0, 0), (-1, -1), 6),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        table = LongTable(expense_data, colWidths=col_widths, repeatRows=1, splitByRow=True)
+        table.setStyle(table_style)
         elements.append(table)
 
         doc.build(elements)
         buffer.seek(0)
         return buffer
 
+class _EventLog:
+    # One per server: every session appends through the same handle and takes its sequence
+    # numbers from the same counter, so the log stays in a single, strictly increasing order
+    def __init__(self):
+        self.lock = threading.Lock()
+        state = _read_state()
+        self.seq = state.seq
+        self.snapshot_seq = state.snapshot_seq
+        self.file = open(EVENTS_FILE, 'ab')
+
+@st.cache_resource
+def _event_log():
+    return _EventLog()
+
+@st.cache_resource
+def _pdf_pool():
+    # Shared across sessions so exports don't block the script run that requested them
+    return concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+def apply_event(state, event):
+    # state is st.session_state for live changes, or a fresh namespace when rebuilding from disk
+    calculators = state.calculators
+    op = event['op']
+    if op == 'create_calculator':
+        calculators.setdefault(event['calc'], ExpenseTracker(event['calc']))
+    elif op == 'set_current':
+        if event['calc'] is None or event['calc'] in calculators:
+            state.current_calculator = event['calc']
+    elif event['calc'] not in calculators:
+        # Another session deleted this calculator before the event was logged
+        return
+    elif op == 'delete_calculator':
+        del calculators[event['calc']]
+    else:
+        tracker = calculators[event['calc']]
+        if op == 'add_friend':
+            tracker.add_friend(event['name'])
+        elif op == 'remove_friend':
+            tracker.remove_friend(event['name'])
+        elif op == 'add_bill':
+            tracker.bills.append(event['bill'])
+        elif op == 'submit_bills':
+            # Events logged before bills were recorded in the payload submitted everything pending
+            tracker.submit_bills(event.get('bills', tracker.bills), event['date'])
+        elif op == 'cancel_expense':
+            tracker.cancel_expense(event['id'])
+        else:
+            raise ValueError(f"Unknown event: {op}")
+
+def record(op, **payload):
+    # Apply a change and append it to the event log instead of rewriting all state on every click
+    log = _event_log()
+    with log.lock:
+        # Apply on top of every session's events, so the expense ids assigned here are the
+        # ones replay will assign
+        if st.session_state.log_seq != log.seq:
+            _sync_session(log)
+        event = {'seq': log.seq + 1, 'op': op, **payload}
+        apply_event(st.session_state, event)
+        log.file.write(orjson.dumps(event) + b'\n')
+        log.file.flush()
+        log.seq = st.session_state.log_seq = event['seq']
+        if log.seq - log.snapshot_seq >= SNAPSHOT_EVERY:
+            save_data()
+
 def save_data():
+    # Called with the log lock held. The snapshot is rebuilt from disk rather than taken from
+    # this session's state, so truncating the log can't discard other sessions' events.
+    log = _event_log()
+    state = _read_state()
     data = {
-        'calculators': {name: calc.__dict__ for name, calc in st.session_state.calculators.items()},
-        'current_calculator': st.session_state.current_calculator
+        'calculators': {name: calc.__dict__ for name, calc in state.calculators.items()},
+        'current_calculator': state.current_calculator,
+        'seq': state.seq
     }
-    with open('expense_tracker_data.json', 'w') as f:
-        json.dump(data, f)
-
-def load_data():
-    if os.path.exists('expense_tracker_data.json'):
-        with open('expense_tracker_data.json', 'r') as f:
-            data = json.load(f)
-        st.session_state.calculators = {name: ExpenseTracker(name) for name in data['calculators']}
+    # Serialize up front so the file gets one write, then swap it in atomically
+    payload = orjson.dumps(data)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(DATA_FILE)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb', buffering=1 << 20) as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(fd)  # make sure the bytes are on disk before the rename publishes them
+        os.replace(tmp_path, DATA_FILE)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    # Everything in the log is now covered by the snapshot
+    log.file.truncate(0)
+    log.snapshot_seq = data['seq']
+
+def _read_state():
+    # Latest state on disk: the snapshot plus every event logged after it
+    state = types.SimpleNamespace(calculators={}, current_calculator=None, snapshot_seq=0)
+    if os.path.exists(DATA_FILE):
+        with open(DATA_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
+        state.calculators = {name: ExpenseTracker(name) for name in data['calculators']}
         for name, calc_data in data['calculators'].items():
-            st.session_state.calculators[name].__dict__.update(calc_data)
-        st.session_state.current_calculator = data['current_calculator']
+            calc = state.calculators[name]
+            calc.__dict__.update(calc_data)
+            # Older saves stored expenses as a list with ids derived from its length, which
+            # repeat after a cancel, so renumber them rather than trust the stored ones
+            if isinstance(calc.expenses, list):
+                calc.expenses = {str(i): dict(e, id=str(i)) for i, e in enumerate(calc.expenses, 1)}
+            for expense in calc.expenses.values():
+                if 'dateDisplay' not in expense:
+                    expense['dateDisplay'] = datetime.fromisoformat(expense['date']).strftime(DATE_FORMAT)
+                if 'perPersonCents' not in expense:
+                    _split_cents(expense)
+            if 'next_expense_id' not in calc_data:
+                calc.next_expense_id = max((int(i) for i in calc.expenses), default=0) + 1
+            # Older saves kept symmetric pairwise balances or net positions in float dollars
+            if 'balances' in calc_data:
+                calc.net_cents = {friend: round(sum(owes.values()) * 100) for friend, owes in calc.__dict__.pop('balances').items()}
+            elif 'net' in calc_data:
+                calc.net_cents = {friend: round(amount * 100) for friend, amount in calc.__dict__.pop('net').items()}
+            calc.net_cents = defaultdict(int, calc.net_cents)
+            calc.__dict__.pop('version', None)  # cache-key counter no longer kept
+        state.current_calculator = data['current_calculator']
+        state.snapshot_seq = data.get('seq', 0)
+    state.seq = state.snapshot_seq
+    if os.path.exists(EVENTS_FILE):
+        with open(EVENTS_FILE, 'rb') as f:
+            lines = f.read().splitlines()
+        for line in lines:
+            try:
+                event = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # blank, or cut short by a crash mid-append
+            # Events at or below the snapshot's seq were logged before it was written
+            if event['seq'] > state.snapshot_seq:
+                apply_event(state, event)
+                state.seq = max(state.seq, event['seq'])
+    if state.current_calculator not in state.calculators:
+        state.current_calculator = None
+    return state
+
+def _sync_session(log):
+    # Called with the log lock held. Rebuild this session's copy from disk so it includes
+    # other sessions' events, staying on the current page if that calculator still exists.
+    state = _read_state()
+    if 'calculators' in st.session_state:
+        current = st.session_state.current_calculator
     else:
-        st.session_state.calculators = {}
-        st.session_state.current_calculator = None
+        current = state.current_calculator
+    st.session_state.calculators = state.calculators
+    st.session_state.current_calculator = current if current in state.calculators else None
+    st.session_state.log_seq = log.seq
+
+def load_data():
+    log = _event_log()
+    with log.lock:
+        _sync_session(log)
 
 def main():
     st.set_page_config(page_title="Expense Tracker", layout="wide")
     
-    if 'calculators' not in st.session_state:
+    # Pick up other sessions' changes before rendering, so ids on screen match the log
+    if 'calculators' not in st.session_state or st.session_state.log_seq != _event_log().seq:
         load_data()
 
-    
 
     # Page 1: Calculator List
     if st.session_state.current_calculator is None:
@@ -181,26 +435,27 @@ def main():
                - Do not attempt to remove friends after submission of bills
             """)
         st.header("My Calculators")
-        for calc_name in list(st.session_state.calculators.keys()):  # Use list() to avoid runtime modification issues
+        if st.session_state.calculators:
+            # One selectbox and a fixed pair of buttons, however many calculators there are
+            choice = st.selectbox("Calculator", list(st.session_state.calculators.keys()))
             col1, col2, col3 = st.columns([3, 1, 1])
             with col1:
-                if st.button(f"Open {calc_name}"):
-                    st.session_state.current_calculator = calc_name
+                if st.button("Open"):
+                    st.session_state.current_calculator = choice
                     st.rerun()
             with col2:
-                if st.button(f"Delete {calc_name}"):
-                    st.session_state.calculator_to_delete = calc_name
+                if st.button("Delete"):
+                    st.session_state.calculator_to_delete = choice
                     st.rerun()
-            
+
         if 'calculator_to_delete' in st.session_state:
             calc_name = st.session_state.calculator_to_delete
             st.warning(f"Are you sure you want to delete {calc_name}?")
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("Yes, delete"):
-                    del st.session_state.calculators[calc_name]
+                    record('delete_calculator', calc=calc_name)
                     del st.session_state.calculator_to_delete
-                    save_data()
                     st.success(f"{calc_name} has been deleted.")
                     st.rerun()
             with col2:
@@ -209,15 +464,15 @@ def main():
                     st.rerun()
         
         st.subheader("Create New Calculator")
-        new_calc_name = st.text_input("Enter calculator name")
-        if st.button("Create"):
-            if new_calc_name and new_calc_name not in st.session_state.calculators:
-                st.session_state.calculators[new_calc_name] = ExpenseTracker(new_calc_name)
-                st.session_state.current_calculator = new_calc_name
-                save_data()
-                st.rerun()
-            elif new_calc_name in st.session_state.calculators:
-                st.error("A calculator with this name already exists.")
+        with st.form("create_calculator_form"):
+            new_calc_name = st.text_input("Enter calculator name")
+            if st.form_submit_button("Create"):
+                if new_calc_name and new_calc_name not in st.session_state.calculators:
+                    record('create_calculator', calc=new_calc_name)
+                    record('set_current', calc=new_calc_name)
+                    st.rerun()
+                elif new_calc_name in st.session_state.calculators:
+                    st.error("A calculator with this name already exists.")
     
     # Page 2: Expense Tracker
     else:
@@ -225,30 +480,26 @@ def main():
         st.title(f"{tracker.name}".upper())
 
         if st.button("Back to Calculator List"):
-            st.session_state.current_calculator = None
-            save_data()
+            record('set_current', calc=None)
             st.rerun()
 
         # Add Friend Section
-        with st.container():
-            
+        with st.form("friend_form"):
             col1, col2 = st.columns(2)
             with col1:
                 new_friend = st.text_input("Enter friend's name")
-                if st.button("Add Friend"):
-                    if new_friend:
-                        tracker.add_friend(new_friend)
-                        st.success(f"Added {new_friend} to the group!")
-                        save_data()
-                        st.rerun()
+                add_submitted = st.form_submit_button("Add Friend")
             with col2:
                 friend_to_remove = st.selectbox("Select friend to remove", tracker.friends)
-                if st.button("Remove Friend"):
-                    if friend_to_remove:
-                        tracker.remove_friend(friend_to_remove)
-                        st.success(f"Removed {friend_to_remove} from the group!")
-                        save_data()
-                        st.rerun()
+                remove_submitted = st.form_submit_button("Remove Friend")
+            if add_submitted and new_friend:
+                record('add_friend', calc=tracker.name, name=new_friend)
+                st.success(f"Added {new_friend} to the group!")
+                st.rerun()
+            if remove_submitted and friend_to_remove:
+                record('remove_friend', calc=tracker.name, name=friend_to_remove)
+                st.success(f"Removed {friend_to_remove} from the group!")
+                st.rerun()
 
         # Add Bills Section
         with st.container():
@@ -263,14 +514,13 @@ def main():
                     try:
                         amount_float = float(amount)
                         if description and amount_float > 0 and paid_by and split_among:
-                            tracker.bills.append({
+                            record('add_bill', calc=tracker.name, bill={
                                 "description": description,
                                 "amount": amount_float,
                                 "paidBy": paid_by,
                                 "splitAmong": split_among
                             })
                             st.success("Bill added successfully!")
-                            save_data()
                             st.rerun()
                         else:
                             st.error("Please fill in all fields correctly.")
@@ -284,62 +534,83 @@ def main():
         if tracker.bills:
             with st.container():
                 st.subheader("Current Bills")
-                df = pd.DataFrame(tracker.bills)
-                df['amount'] = df['amount'].apply(lambda x: f"${x:.2f}")
-                df['splitAmong'] = df['splitAmong'].apply(lambda x: ', '.join(x))
-                df.columns = ['Description', 'Amount', 'Paid By', 'Split Among']  # Rename columns
-                
-                # Apply styling without additional formatting for Amount
-                styled_df = df.style.set_properties(**{'font-weight': 'bold'}, subset=['Description', 'Amount', 'Paid By', 'Split Among'])
-                
-                # Convert to HTML and remove the index column using CSS
-                html = styled_df.to_html(index=False)  # Exclude index directly in to_html method
-                html = html.replace('<table', '<table style="border-collapse: collapse; width: 100%;"')
-                html = html.replace('<th>', '<th style="border: 1px solid #ddd; padding: 8px; background-color: #f2f2f2;">')
-                html = html.replace('<td>', '<td style="border: 1px solid #ddd; padding: 8px;">')
-                
+                # The table is small, so build the HTML directly rather than going through a DataFrame styler
+                th = '<th style="border: 1px solid #ddd; padding: 8px; background-color: #f2f2f2;">'
+                td = '<td style="border: 1px solid #ddd; padding: 8px; font-weight: bold;">'
+                header = ''.join(f"{th}{col}</th>" for col in ['Description', 'Amount', 'Paid By', 'Split Among'])
+                rows = ''.join(
+                    f"<tr>{td}{bill['description']}</td>{td}${bill['amount']:.2f}</td>"
+                    f"{td}{bill['paidBy']}</td>{td}{', '.join(bill['splitAmong'])}</td></tr>"
+                    for bill in tracker.bills
+                )
+                html = f'<table style="border-collapse: collapse; width: 100%;"><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>'
+
                 st.markdown(html, unsafe_allow_html=True)
 
                 if st.button("Submit All Bills"):
-                    for bill in tracker.bills:
-                        tracker.add_expense(bill["paidBy"], bill["amount"], bill["description"], bill["splitAmong"])
-                    tracker.bills = []
+                    # Submit the bills this tab was showing; the rerun has already merged in any other tabs added
+                    record('submit_bills', calc=tracker.name, bills=st.session_state.get('shown_bills', tracker.bills),
+                           date=datetime.now().isoformat())
                     st.success("All bills submitted successfully!")
-                    save_data()
                     st.rerun()
+                st.session_state.shown_bills = list(tracker.bills)
 
         # Expense History
         with st.container():
             st.subheader("Expense History")
-            for expense in tracker.expenses:
+            expenses = list(tracker.expenses.values())
+            older, recent = expenses[:-HISTORY_EXPANDERS], expenses[-HISTORY_EXPANDERS:]
+            if older:
+                # Building the rows is cheaper than hashing them for st.cache_data, so don't cache
+                history = [{
+                    'Date Added': e['dateDisplay'],
+                    'Description': e['description'],
+                    'Amount': f"${e['amount']:.2f}",
+                    'Paid By': e['paidBy'],
+                    'Split Among': ', '.join(e['splitAmong'])
+                } for e in older]
+                st.dataframe(history, hide_index=True, use_container_width=True)
+            for expense in recent:
                 with st.expander(f"{expense['description']} - ${expense['amount']:.2f}"):
                     st.write(f"Paid by: {expense['paidBy']}")
                     st.write(f"Split among: {', '.join(expense['splitAmong'])}")
-                    st.write(f"Date: {datetime.fromisoformat(expense['date']).strftime('%d/%m/%Y %H%MH')}")
+                    st.write(f"Date: {expense['dateDisplay']}")
                     if st.button("Cancel Expense", key=f"cancel_{expense['id']}"):
-                        tracker.cancel_expense(expense['id'])
+                        record('cancel_expense', calc=tracker.name, id=expense['id'])
                         st.success("Expense cancelled successfully!")
-                        save_data()
                         st.rerun()
 
         # Current Balances
         with st.container():
             st.subheader("Current Balances")
-            balance_html = "<div style='border: 2px solid #ddd; padding: 10px; border-radius: 5px;'>"
-            for friend, owes in tracker.balances.items():
-                balance_html += f"<h3>{friend}</h3>"
-                for ower, amount in owes.items():
-                    if amount > 0:
-                        balance_html += f"<p>{ower} owes {friend} ${amount:.2f}</p>"
-            balance_html += "</div>"
+            balance_html = _render_balances_html(tracker.friends, tracker.net_cents)
             st.markdown(balance_html, unsafe_allow_html=True)
 
         # Export to PDF
+        # Anything the report shows changes one of these, so an export for a different key is stale
+        export_key = (tracker.name, tracker.next_expense_id, len(tracker.expenses), tuple(tracker.friends))
         if st.button("Export to PDF"):
-            pdf_buffer = tracker.export_to_pdf()
-            b64 = base64.b64encode(pdf_buffer.getvalue()).decode()
-            href = f'<a href="data:application/octet-stream;base64,{b64}" download="expense_tracker_report_{tracker.name}.pdf">Download PDF Report</a>'
-            st.markdown(href, unsafe_allow_html=True)
+            # Render from a copy so later clicks can't mutate the tracker mid-export
+            st.session_state.pdf_export = (export_key, _pdf_pool().submit(
+                copy.deepcopy(tracker).export_to_pdf, _pdf_styles(), _pdf_table_style()))
+        if st.session_state.get('pdf_export') and st.session_state.pdf_export[0] != export_key:
+            del st.session_state.pdf_export
+        if st.session_state.get('pdf_export'):
+            export = st.session_state.pdf_export[1]
+            if isinstance(export, concurrent.futures.Future):
+                if not export.done():
+                    st.info("Generating PDF report...")
+                    st.button("Refresh")
+                elif export.exception() is not None:
+                    st.error(f"PDF export failed: {export.exception()}")
+                    del st.session_state.pdf_export
+                else:
+                    # Encode once and keep the link, so later reruns don't redo it
+                    b64 = base64.b64encode(export.result().getvalue()).decode()
+                    href = f'<a href="data:application/octet-stream;base64,{b64}" download="expense_tracker_report_{tracker.name}.pdf">Download PDF Report</a>'
+                    st.session_state.pdf_export = (export_key, href)
+            if st.session_state.get('pdf_export'):
+                st.markdown(st.session_state.pdf_export[1], unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file